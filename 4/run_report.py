@@ -1,47 +1,190 @@
 import argparse
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from multiprocessing import Pool
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # ไม่ต้องใช้ GUI backend สำหรับการ render ลงไฟล์
 import matplotlib.pyplot as plt
 import seaborn as sns
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from pyarrow import parquet as pq
+
+# column ข้อความที่เหลือให้เป็น string ของ PyArrow แทน object ของ Python
+pd.options.future.infer_string = True
+
+# Schema ของไฟล์ Transection (วันที่เก็บเป็น YYYYMMDD, 0 = ไม่มีค่า)
+TRAN_COLUMN_TYPES = {
+    'FRPDATE': pa.int32(),
+    'FNPLFDTE': pa.int32(),
+    'FORDATE': pa.int32(),
+    'FMATDATE': pa.int32(),
+    'FCUSNO': pa.int64(),
+    'FACCNO': pa.int64(),
+    'FPRODTY': pa.dictionary(pa.int32(), pa.string()),
+    'FFLGBWFW': pa.string(),
+    'FPRINCAM': pa.float64(),
+    'FDPDUE00': pa.float64(),
+}
+
+# หนึ่งแถวของ Transection คือหนึ่งบัญชี ณ วันที่รายงาน
+TRAN_KEY = ['FRPDATE', 'FACCNO']
+
+# column ที่ pipeline ต้องใช้ ตรวจครั้งเดียวตอนโหลด
+EXPECTED_TRAN_COLS = frozenset(TRAN_COLUMN_TYPES)
+EXPECTED_PERF_COLS = frozenset({'CIF', 'STAGE_CIF'})
+# คอลัมน์วันที่ (YYYYMMDD) ในไฟล์ transaction
+DATE_COLS = ['FRPDATE', 'FNPLFDTE', 'FORDATE', 'FMATDATE']
+# ตำแหน่งใน list คือรหัส stage; ค่าอื่นหรือไม่มีข้อมูลเป็น 0. Unknown
+STAGE_NAMES = ['0. Unknown', '1. Performing', '2. Under-performing', '3. NPL']
+DPD_LABELS = ['0. No DPD', '1. 1-30 Days', '2. 31-60 Days', '3. 61-90 Days', '4. 90+ Days']
+
+def check_columns(columns, expected, name: str):
+    """ตรวจว่ามี column ครบตาม schema ที่ pipeline ต้องใช้"""
+    missing = expected.difference(columns)
+    if missing:
+        raise ValueError(f"{name} is missing columns: {sorted(missing)}")
+
+def cache_is_fresh(cache: str, src: str):
+    """cache ใช้ได้เมื่อมีไฟล์และแก้ไขไม่เก่ากว่าไฟล์ต้นทาง"""
+    return os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(src)
+
+def write_atomic(path: str, write):
+    """เขียนไฟล์ผ่าน temp file ในโฟลเดอร์เดียวกันแล้ว os.replace ทับ เพื่อไม่ให้เหลือ cache ที่เขียนไม่ครบ"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.', suffix='.parquet')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def read_transactions(path: str):
+    """อ่านไฟล์ Transection ด้วย PyArrow ตาม schema ที่กำหนด โดยเก็บ Parquet cache ไว้ข้างไฟล์ CSV"""
+    cache = os.path.splitext(path)[0] + '.parquet'
+    if cache_is_fresh(cache, path):
+        tbl = pq.read_table(cache, memory_map=True)
+        check_columns(tbl.column_names, EXPECTED_TRAN_COLS, cache)
+        return tbl.to_pandas()
+    # strip ชื่อ column ก่อน parse เพื่อให้ column_types จับคู่ได้แม้ header มีช่องว่าง
+    with open(path, encoding='utf-8-sig') as f:
+        columns = [c.strip() for c in f.readline().rstrip('\r\n').split('|')]
+    tbl = pacsv.read_csv(
+        path,
+        read_options=pacsv.ReadOptions(column_names=columns, skip_rows=1),
+        parse_options=pacsv.ParseOptions(delimiter='|'),
+        convert_options=pacsv.ConvertOptions(column_types=TRAN_COLUMN_TYPES,
+                                             strings_can_be_null=True),
+    )
+    check_columns(tbl.column_names, EXPECTED_TRAN_COLS, path)
+    write_atomic(cache, lambda tmp: pq.write_table(tbl, tmp, compression='zstd', row_group_size=256_000))
+    return tbl.to_pandas()
+
+def read_performance(src: str = 'Performance.xlsx', cache: str = 'Performance.parquet'):
+    """อ่าน Performance.xlsx โดยใช้ Parquet cache ถ้า cache ใหม่กว่าไฟล์ต้นทาง"""
+    if cache_is_fresh(cache, src):
+        df_perf = pd.read_parquet(cache, engine='pyarrow')
+    else:
+        df_perf = pd.read_excel(src, sheet_name='Sheet1', engine='calamine')
+        df_perf.columns = df_perf.columns.str.strip()
+        write_atomic(cache, lambda tmp: df_perf.to_parquet(tmp, engine='pyarrow', compression='zstd'))
+    # ตรวจและ normalise ทั้งกรณีอ่านจาก xlsx และจาก cache (cache อาจมาจากเวอร์ชันเก่า)
+    check_columns(df_perf.columns, EXPECTED_PERF_COLS, cache)
+    # CIF ต้องเป็น int64 ตรงกับ FCUSNO เพื่อให้ join ใช้ hash ของ int64 โดยตรง
+    return df_perf.dropna(subset=['CIF']).astype({'CIF': 'int64'})
+
+def parse_yyyymmdd(s):
+    """แปลงวันที่ YYYYMMDD โดย parse เฉพาะค่าที่ไม่ซ้ำแล้ว map กลับทุกแถว"""
+    uniques, inverse = np.unique(s.to_numpy(), return_inverse=True)
+    parsed = pd.to_datetime(uniques, format='%Y%m%d', errors='coerce')
+    return pd.Series(parsed.to_numpy()[inverse.ravel()], index=s.index, name=s.name)
+
+def days_between(end, start):
+    """จำนวนวันระหว่าง column datetime64 สอง column คำนวณบน int64 buffer (NaT -> NaN)"""
+    # ตัวหารหนึ่งวันคิดตามหน่วยจริงของ column (ns ใน pandas 2, us ใน pandas 3)
+    diff = end.to_numpy() - start.to_numpy()
+    one_day = np.timedelta64(1, 'D').astype(diff.dtype).view('i8')
+    days = (diff.view('i8') // one_day).astype('int32')
+    missing = np.isnat(diff)
+    if missing.any():
+        days = days.astype('float64')
+        days[missing] = np.nan
+    return days
+
+def year_quarter(dates):
+    """ปีและไตรมาสจาก column datetime64 ด้วยเลขจำนวนเต็มบน buffer ระดับเดือน (NaT -> NaN)"""
+    d = dates.to_numpy()
+    months = d.astype('datetime64[M]').view('i8')
+    year = (months // 12 + 1970).astype('int16')
+    quarter = (months % 12 // 3 + 1).astype('int8')
+    missing = np.isnat(d)
+    if missing.any():
+        year = np.where(missing, np.nan, year)
+        quarter = np.where(missing, np.nan, quarter)
+    return year, quarter
+
+def stage_summary(df):
+    """sum/mean/count ของ FPRINCAM แยกตาม Stage_Name ด้วย np.bincount ในรอบเดียว"""
+    stage = df['Stage_Name'].astype('category')
+    n = len(stage.cat.categories)
+    codes = stage.cat.codes.to_numpy()
+    vals = df['FPRINCAM'].to_numpy(dtype='float64')
+    valid = ~np.isnan(vals)
+    sums = np.bincount(codes[valid], weights=vals[valid], minlength=n)
+    counts = np.bincount(codes[valid], minlength=n)
+    means = np.divide(sums, counts, out=np.full(n, np.nan), where=counts > 0)
+    index = pd.Index(stage.cat.categories, name='Stage_Name')
+    summary = pd.DataFrame({'sum': sums, 'mean': means, 'count': counts}, index=index)
+    # แสดงเฉพาะ stage ที่มีในข้อมูล เหมือน groupby(observed=True)
+    return summary[np.bincount(codes, minlength=n) > 0]
+
+def kde_curve(values, gridsize: int = 200):
+    """Gaussian KDE (Scott's rule) บนช่วงของข้อมูล ประเมินจากค่าที่ไม่ซ้ำถ่วงด้วยจำนวนครั้ง"""
+    uniques, weights = np.unique(values, return_counts=True)
+    bw = values.std(ddof=1) * len(values) ** (-1 / 5)
+    grid = np.linspace(values.min(), values.max(), gridsize)
+    z = (grid[:, None] - uniques[None, :]) / bw
+    density = np.exp(-0.5 * z ** 2) @ weights / (len(values) * bw * np.sqrt(2 * np.pi))
+    return grid, density
 
 def load_data(report_date: str):
     """โหลดข้อมูลตามวันที่รายงาน"""
     print(f"Loading data for {report_date}...")
-    df_tran = pd.read_csv(f'Transection_{report_date}.csv', sep='|', encoding='utf-8-sig')
-    df_perf = pd.read_excel('Performance.xlsx', sheet_name='Sheet1')
-    
-    # Strip columns เพื่อให้ชื่อคอลัมน์สะอาด
-    df_tran.columns = df_tran.columns.str.strip()
-    df_perf.columns = df_perf.columns.str.strip()
-    
-    return df_tran, df_perf
+    # อ่าน CSV และ Performance พร้อมกัน (ทั้งสองปล่อย GIL ระหว่าง I/O และ parse)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_tran = ex.submit(read_transactions, f'Transection_{report_date}.csv')
+        f_perf = ex.submit(read_performance)
+        return f_tran.result(), f_perf.result()
 
 def clean_data(df_tran, df_perf):
     """ทำความสะอาดข้อมูล"""
     print("Cleaning data...")
 
     # แปลงวันที่
-    df_tran['FRPDATE'] = pd.to_datetime(df_tran['FRPDATE'], format='%Y%m%d', errors='coerce')
-    df_tran['FNPLFDTE'] = pd.to_datetime(df_tran['FNPLFDTE'], format='%Y%m%d', errors='coerce')
-    df_tran['FORDATE'] = pd.to_datetime(df_tran['FORDATE'], format='%Y%m%d', errors='coerce')
-    df_tran['FMATDATE'] = pd.to_datetime(df_tran['FMATDATE'], format='%Y%m%d', errors='coerce')
+    for col in DATE_COLS:
+        df_tran[col] = parse_yyyymmdd(df_tran[col])
 
-    df_tran.drop_duplicates(inplace=True)
+    df_tran.drop_duplicates(subset=TRAN_KEY, inplace=True)
 
     # Merge ข้อมูล
-    df_merged = pd.merge(df_tran, df_perf, left_on='FCUSNO', right_on='CIF', how='left')
-
-    # กรณี merge แล้วมี column ซ้ำ
-    if 'FRPDATE_x' in df_merged.columns:
-        df_merged.rename(columns={'FRPDATE_x': 'FRPDATE'}, inplace=True)
-    if 'FRPDATE_y' in df_merged.columns:
-        df_merged.drop(columns=['FRPDATE_y'], inplace=True)
+    # ใช้เฉพาะ STAGE_CIF จาก Performance จึงไม่มี column ซ้ำหลัง join
+    df_perf_i = df_perf.set_index('CIF')[['STAGE_CIF']]
+    df_merged = df_tran.join(df_perf_i, on='FCUSNO', how='left')
+    df_merged.reset_index(drop=True, inplace=True)
 
     # เติมค่า missing
-    if 'FDPDUE00' in df_merged.columns:
-        df_merged['FDPDUE00'] = pd.to_numeric(df_merged['FDPDUE00'], errors='coerce').fillna(0)
-    else:
-        df_merged['FDPDUE00'] = 0
+    df_merged['FDPDUE00'] = df_merged['FDPDUE00'].fillna(0)
+
+    # ลดขนาด dtype เพื่อลด memory bandwidth ในขั้น groupby/plot
+    df_merged['FDPDUE00'] = df_merged['FDPDUE00'].astype('int16')
+    df_merged['STAGE_CIF'] = df_merged['STAGE_CIF'].astype('Int8')
+    df_merged['FPRODTY'] = df_merged['FPRODTY'].astype('category')
 
     return df_merged
 
@@ -50,41 +193,107 @@ def feature_engineer(df_merged):
     print("Engineering features...")
 
     # Map Stage
-    stage_map = {1: '1. Performing', 2: '2. Under-performing', 3: '3. NPL'}
-    df_merged['Stage_Name'] = df_merged['STAGE_CIF'].map(stage_map).fillna('0. Unknown')
+    stage = df_merged['STAGE_CIF'].to_numpy(dtype='int8', na_value=0)
+    codes = np.where(np.isin(stage, [1, 2, 3]), stage, 0).astype('int8')
+    df_merged['Stage_Name'] = pd.Categorical.from_codes(codes, categories=STAGE_NAMES)
 
     # Overdue
-    df_merged['Is_Overdue'] = df_merged['FDPDUE00'] > 0
+    dpd = df_merged['FDPDUE00'].to_numpy()
+    df_merged['Is_Overdue'] = dpd > 0
 
     # DPD Bucket
-    bins = [-1, 0, 30, 60, 90, float('inf')]
-    labels = ['0. No DPD','1. 1-30 Days','2. 31-60 Days','3. 61-90 Days','4. 90+ Days']
-    df_merged['DPD_Bucket'] = pd.cut(df_merged['FDPDUE00'], bins=bins, labels=labels, right=True)
+    # ช่วงเป็นแบบปิดขวา (-1, 0], (0, 30], ... เหมือน pd.cut(right=True)
+    codes = np.searchsorted(np.array([0, 30, 60, 90], dtype=dpd.dtype), dpd, side='left').astype('int8')
+    codes[~(dpd > -1)] = -1
+    df_merged['DPD_Bucket'] = pd.Categorical.from_codes(codes, categories=DPD_LABELS, ordered=True)
 
-    # แปลงเป็น numeric สำหรับคำนวณ
+    # FFLGBWFW ในไฟล์เป็น flag (F/N) จึงยังต้อง coerce เป็น numeric
     df_merged['FFLGBWFW'] = pd.to_numeric(df_merged['FFLGBWFW'], errors='coerce')
-    df_merged['FPRINCAM'] = pd.to_numeric(df_merged['FPRINCAM'], errors='coerce')
 
     # Debt to Limit Ratio
-    df_merged['Debt_to_Limit_Ratio'] = np.where(
-        df_merged['FFLGBWFW'] > 0,
-        df_merged['FPRINCAM'] / df_merged['FFLGBWFW'],
-        np.nan
-    )
+    limit = df_merged['FFLGBWFW'].to_numpy(dtype='float64')
+    ratio = np.full(len(limit), np.nan)
+    np.divide(df_merged['FPRINCAM'].to_numpy(dtype='float64'), limit, out=ratio, where=limit > 0)
+    df_merged['Debt_to_Limit_Ratio'] = ratio
 
     # อายุสินเชื่อและ tenor
-    df_merged['Loan_Age_Days'] = (df_merged['FRPDATE'] - df_merged['FORDATE']).dt.days
-    df_merged['Remaining_Tenor_Days'] = (df_merged['FMATDATE'] - df_merged['FRPDATE']).dt.days
-    df_merged['Loan_Orig_Year'] = df_merged['FORDATE'].dt.year
-    df_merged['Loan_Orig_Quarter'] = df_merged['FORDATE'].dt.quarter
+    df_merged['Loan_Age_Days'] = days_between(df_merged['FRPDATE'], df_merged['FORDATE'])
+    df_merged['Remaining_Tenor_Days'] = days_between(df_merged['FMATDATE'], df_merged['FRPDATE'])
+    df_merged['Loan_Orig_Year'], df_merged['Loan_Orig_Quarter'] = year_quarter(df_merged['FORDATE'])
 
     return df_merged
 
-def create_report(df_merged, report_date: str):
+def build_features_polars(report_date: str):
+    """load → clean → feature_engineer ทั้งชุดเป็น lazy plan ของ Polars แล้วแปลงเป็น pandas ครั้งเดียว"""
+    import polars as pl
+
+    print(f"Building features with Polars for {report_date}...")
+    path = f'Transection_{report_date}.csv'
+
+    lf_tran = pl.scan_csv(
+        path,
+        separator='|',
+        with_column_names=lambda cols: [c.strip() for c in cols],
+        schema_overrides={
+            **{c: pl.Int32 for c in DATE_COLS},
+            'FCUSNO': pl.Int64,
+            'FACCNO': pl.Int64,
+            'FPRODTY': pl.Categorical,
+            'FFLGBWFW': pl.String,
+            'FPRINCAM': pl.Float64,
+            'FDPDUE00': pl.Float64,
+        },
+    )
+    check_columns(lf_tran.collect_schema().names(), EXPECTED_TRAN_COLS, path)
+    lf_perf = pl.from_pandas(read_performance()[['CIF', 'STAGE_CIF']]).lazy()
+
+    dpd = pl.col('FDPDUE00')
+    limit = pl.col('FFLGBWFW')
+    df = (
+        lf_tran
+        .with_columns([pl.col(c).cast(pl.String).str.to_date('%Y%m%d', strict=False)
+                       .cast(pl.Datetime('ns')) for c in DATE_COLS])
+        .unique(subset=TRAN_KEY, keep='first', maintain_order=True)
+        .join(lf_perf, left_on='FCUSNO', right_on='CIF', how='left', maintain_order='left')
+        .with_columns(
+            dpd.fill_null(0).cast(pl.Int16),
+            pl.col('STAGE_CIF').cast(pl.Int8),
+            limit.cast(pl.Float64, strict=False),
+        )
+        .with_columns(
+            pl.col('STAGE_CIF').fill_null(0)
+            .replace_strict([1, 2, 3], STAGE_NAMES[1:], default=STAGE_NAMES[0],
+                            return_dtype=pl.Enum(STAGE_NAMES))
+            .alias('Stage_Name'),
+            (dpd > 0).alias('Is_Overdue'),
+            pl.when(dpd > -1)
+            .then(dpd.cut([0, 30, 60, 90], labels=DPD_LABELS).cast(pl.Enum(DPD_LABELS)))
+            .alias('DPD_Bucket'),
+            pl.when(limit > 0).then(pl.col('FPRINCAM') / limit).alias('Debt_to_Limit_Ratio'),
+            (pl.col('FRPDATE') - pl.col('FORDATE')).dt.total_days().cast(pl.Int32).alias('Loan_Age_Days'),
+            (pl.col('FMATDATE') - pl.col('FRPDATE')).dt.total_days().cast(pl.Int32).alias('Remaining_Tenor_Days'),
+            pl.col('FORDATE').dt.year().cast(pl.Int16).alias('Loan_Orig_Year'),
+            pl.col('FORDATE').dt.quarter().cast(pl.Int8).alias('Loan_Orig_Quarter'),
+        )
+        .collect()
+        .to_pandas()
+    )
+
+    # ปรับ dtype ให้ตรงกับ pipeline ของ pandas (nullable int และ ordered bucket)
+    df['STAGE_CIF'] = df['STAGE_CIF'].astype('Int8')
+    df['DPD_Bucket'] = df['DPD_Bucket'].cat.as_ordered()
+    return df
+
+def create_report(df_merged, report_date: str, dpi: int = 150):
     """สร้างรายงานและ Dashboard"""
     print("Creating report and dashboard...")
 
-    report_by_stage = df_merged.groupby('Stage_Name')['FPRINCAM'].agg(['sum', 'mean', 'count'])
+    report_by_stage = stage_summary(df_merged)
+
+    # mask ของกลุ่ม DPD 90+ คำนวณครั้งเดียวบน int16 buffer แล้วใช้ slice เดียวกันทุก panel
+    dpd = df_merged['FDPDUE00'].to_numpy()
+    npl_90 = dpd > 90
+    npl_dpd = dpd[npl_90]
 
     sns.set_theme(style="darkgrid", palette="Blues_d", font="Tahoma")
 
@@ -98,34 +307,75 @@ def create_report(df_merged, report_date: str):
     axes[0, 0].set_title('Account Count by Stage', fontsize=14, fontweight='bold')
 
     # Bar Chart
-    sns.barplot(ax=axes[0, 1], data=report_by_stage.reset_index(),
-                x='Stage_Name', y='sum', palette='viridis')
+    axes[0, 1].bar(report_by_stage.index.astype(str), report_by_stage['sum'].to_numpy(),
+                   color=sns.color_palette('viridis', len(report_by_stage)))
+    axes[0, 1].set_xlabel('Stage_Name')
+    axes[0, 1].set_ylabel('sum')
     axes[0, 1].set_title('Total Principal by Stage', fontsize=14, fontweight='bold')
 
     # Box Plot
-    sns.boxplot(ax=axes[1, 0], data=df_merged, x='FPRODTY', y='FPRINCAM', palette='Set2')
+    by_product = df_merged.groupby('FPRODTY', observed=True)['FPRINCAM']
+    products = [str(k) for k, _ in by_product]
+    groups = [g.dropna().to_numpy() for _, g in by_product]
+    box = axes[1, 0].boxplot(groups, patch_artist=True, medianprops={'color': '0.25'},
+                             flierprops={'marker': '.', 'markersize': 2})
+    for flier in box['fliers']:
+        flier.set_rasterized(True)
+    for patch, color in zip(box['boxes'], sns.color_palette('Set2', len(groups))):
+        patch.set_facecolor(color)
+    axes[1, 0].set_xticks(range(1, len(products) + 1), products)
+    axes[1, 0].set_xlabel('FPRODTY')
+    axes[1, 0].set_ylabel('FPRINCAM')
     axes[1, 0].set_title('Principal Distribution by Product', fontsize=14, fontweight='bold')
     axes[1, 0].set_ylim(0, 12000000)
 
     # Histogram
-    df_npl_90 = df_merged[df_merged['FDPDUE00'] > 90]
-    sns.histplot(ax=axes[1, 1], data=df_npl_90, x='FDPDUE00',
-                 bins=20, kde=True, color='crimson', alpha=0.7)
+    hist, edges = np.histogram(npl_dpd, bins=20)
+    axes[1, 1].bar(edges[:-1], hist, width=np.diff(edges), align='edge',
+                   color='crimson', alpha=0.7, edgecolor='white')
+    if npl_dpd.size > 1 and npl_dpd.std() > 0:
+        grid, density = kde_curve(npl_dpd)
+        axes[1, 1].plot(grid, density * npl_dpd.size * (edges[1] - edges[0]), color='crimson')
+    axes[1, 1].set_xlabel('FDPDUE00')
+    axes[1, 1].set_ylabel('Count')
     axes[1, 1].set_title('DPD Distribution (90+ Days)', fontsize=14, fontweight='bold')
 
     plt.tight_layout(rect=[0, 0.03, 1, 0.96])
-    plt.savefig(f'monthly_dashboard_{report_date}.png', dpi=300, bbox_inches='tight')
+    plt.savefig(f'monthly_dashboard_{report_date}.png', dpi=dpi)
+    plt.close(fig)
     print(f"Report for {report_date} created successfully!")
 
-def main(report_date: str):
+def main(report_date: str, dpi: int = 150, engine: str = 'pandas'):
     """ฟังก์ชันหลัก"""
-    df_tran, df_perf = load_data(report_date)
-    df_merged = clean_data(df_tran, df_perf)
-    df_final = feature_engineer(df_merged)
-    create_report(df_final, report_date)
+    if engine == 'polars':
+        df_final = build_features_polars(report_date)
+    else:
+        df_tran, df_perf = load_data(report_date)
+        df_merged = clean_data(df_tran, df_perf)
+        df_final = feature_engineer(df_merged)
+    create_report(df_final, report_date, dpi)
+
+def run_many(report_dates, dpi: int = 150, engine: str = 'pandas'):
+    """รันหลายวันที่รายงานพร้อมกัน วันละหนึ่ง process"""
+    # สร้าง Performance cache ก่อนแยก process เพื่อไม่ให้หลาย process เขียนไฟล์เดียวกัน
+    read_performance()
+    with Pool(processes=min(len(report_dates), os.cpu_count() or 1)) as pool:
+        pool.map(partial(main, dpi=dpi, engine=engine), report_dates)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run NPL Report Pipeline')
-    parser.add_argument('--date', required=True, help='Report date in YYYYMMDD format')
+    dates = parser.add_mutually_exclusive_group(required=True)
+    dates.add_argument('--date', help='Report date in YYYYMMDD format')
+    dates.add_argument('--dates', help='Comma-separated report dates, run in parallel')
+    parser.add_argument('--dpi', type=int, default=150,
+                        help='Dashboard resolution (use 300 for the final monthly deliverable)')
+    parser.add_argument('--engine', choices=['pandas', 'polars'], default='pandas',
+                        help='Engine for the load/clean/feature steps')
     args = parser.parse_args()
-    main(args.date)
+    if args.dates is not None:
+        report_dates = [d.strip() for d in args.dates.split(',') if d.strip()]
+        if not report_dates:
+            parser.error('--dates must contain at least one report date')
+        run_many(report_dates, args.dpi, args.engine)
+    else:
+        main(args.date, args.dpi, args.engine)
@@ -1,94 +1,156 @@
 # run_report_prefect_fixed.py - NPL Report with Prefect
+import base64
+import hashlib
+import io
+import os
+from datetime import timedelta
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Literal
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from prefect import task, flow, get_run_logger
+from prefect.serializers import Serializer
+
+# schema, reader และ helper ของ pipeline ใช้ชุดเดียวกับ run_report.py (ตั้ง Agg backend และ infer_string ไว้แล้ว)
+import run_report
+from run_report import (
+    DATE_COLS, DPD_LABELS, STAGE_NAMES, TRAN_KEY,
+    days_between, kde_curve, parse_yyyymmdd, read_performance, read_transactions,
+    stage_summary, year_quarter,
+)
+
+# fingerprint ของโค้ด pipeline (ไฟล์นี้และ reader/schema ใน run_report.py) ใช้ใน cache key ของ Prefect
+_sha = hashlib.sha256()
+for _path in (__file__, run_report.__file__):
+    with open(_path, 'rb') as _src:
+        _sha.update(_src.read())
+CODE_VERSION = _sha.hexdigest()[:16]
+
+class PandasParquetSerializer(Serializer):
+    """เก็บผลลัพธ์ DataFrame ระหว่าง task เป็น Parquet (columnar) แทน cloudpickle"""
+    type: Literal["pandas-parquet"] = "pandas-parquet"
+
+    def dumps(self, obj):
+        buf = io.BytesIO()
+        obj.to_parquet(buf, engine='pyarrow', compression='zstd')
+        # result record ของ Prefect เป็น JSON จึงต้อง encode เป็น base64 เหมือน serializer มาตรฐาน
+        return base64.encodebytes(buf.getvalue())
+
+    def loads(self, blob):
+        return pd.read_parquet(io.BytesIO(base64.decodebytes(blob)), engine='pyarrow')
 
 # ---------------- Tasks ---------------- #
-@task(retries=3, retry_delay_seconds=10)
+def transactions_cache_key(context, parameters):
+    """cache key ของไฟล์ Transection ผูกกับวันที่รายงานและตัวไฟล์ (ดู file_cache_key)"""
+    report_date = parameters['report_date']
+    return file_cache_key(f'transactions-{report_date}', f'Transection_{report_date}.csv')
+
+@task(retries=3, retry_delay_seconds=10,
+      cache_key_fn=transactions_cache_key, cache_expiration=timedelta(days=30),
+      persist_result=True, result_serializer=PandasParquetSerializer())
 def load_data(report_date: str):
     logger = get_run_logger()
     logger.info(f"Loading data for {report_date} ...")
     
-    df_tran = pd.read_csv(f'Transection_{report_date}.csv', sep='|', encoding='utf-8-sig')
-    df_perf = pd.read_excel('Performance.xlsx', sheet_name='Sheet1')
-    
-    # Strip columns
-    df_tran.columns = df_tran.columns.str.strip()
-    df_perf.columns = df_perf.columns.str.strip()
+    df_tran = read_transactions(f'Transection_{report_date}.csv')
     
     logger.info(f"Loaded {len(df_tran):,} transactions")
-    return df_tran, df_perf
+    return df_tran
 
-@task
+def file_cache_key(prefix: str, path: str):
+    """cache key ผูกกับ path เต็ม ขนาด เวลาแก้ไข (ns) ของไฟล์ และเวอร์ชันของโค้ด"""
+    st = os.stat(path)
+    return f"{prefix}-{CODE_VERSION}-{os.path.abspath(path)}-{st.st_size}-{st.st_mtime_ns}"
+
+def performance_cache_key(context, parameters):
+    """cache key ของ Performance.xlsx เพื่อแชร์ผลข้าม flow run"""
+    return file_cache_key('performance', 'Performance.xlsx')
+
+@task(cache_key_fn=performance_cache_key, cache_expiration=timedelta(days=1),
+      persist_result=True, result_serializer=PandasParquetSerializer())
+def load_performance():
+    logger = get_run_logger()
+    logger.info("Loading Performance.xlsx ...")
+    df_perf = read_performance()
+    logger.info(f"Loaded {len(df_perf):,} performance records")
+    return df_perf
+
+@task(persist_result=True, result_serializer=PandasParquetSerializer())
 def clean_data(df_tran, df_perf):
     logger = get_run_logger()
     logger.info("Cleaning data ...")
     
     # แปลงวันที่
-    for col in ['FRPDATE', 'FNPLFDTE', 'FORDATE', 'FMATDATE']:
-        if col in df_tran.columns:
-            df_tran[col] = pd.to_datetime(df_tran[col], format='%Y%m%d', errors='coerce')
+    for col in DATE_COLS:
+        df_tran[col] = parse_yyyymmdd(df_tran[col])
     
-    df_tran.drop_duplicates(inplace=True)
+    df_tran.drop_duplicates(subset=TRAN_KEY, inplace=True)
     
     # Merge ข้อมูล
-    df_merged = pd.merge(df_tran, df_perf, left_on='FCUSNO', right_on='CIF', how='left')
-    
-    # กรณี merge แล้วมี column ซ้ำ
-    if 'FRPDATE_x' in df_merged.columns:
-        df_merged.rename(columns={'FRPDATE_x': 'FRPDATE'}, inplace=True)
-    if 'FRPDATE_y' in df_merged.columns:
-        df_merged.drop(columns=['FRPDATE_y'], inplace=True)
+    # ใช้เฉพาะ STAGE_CIF จาก Performance จึงไม่มี column ซ้ำหลัง join
+    df_perf_i = df_perf.set_index('CIF')[['STAGE_CIF']]
+    df_merged = df_tran.join(df_perf_i, on='FCUSNO', how='left')
+    df_merged.reset_index(drop=True, inplace=True)
     
     # เติมค่า missing
-    if 'FDPDUE00' in df_merged.columns:
-        df_merged['FDPDUE00'] = pd.to_numeric(df_merged['FDPDUE00'], errors='coerce').fillna(0)
-    else:
-        df_merged['FDPDUE00'] = 0
+    df_merged['FDPDUE00'] = df_merged['FDPDUE00'].fillna(0)
+    
+    # ลดขนาด dtype เพื่อลด memory bandwidth ในขั้น groupby/plot
+    df_merged['FDPDUE00'] = df_merged['FDPDUE00'].astype('int16')
+    df_merged['STAGE_CIF'] = df_merged['STAGE_CIF'].astype('Int8')
+    df_merged['FPRODTY'] = df_merged['FPRODTY'].astype('category')
     
     logger.info(f"Cleaned {len(df_merged):,} records")
     return df_merged
 
-@task
+@task(persist_result=True, result_serializer=PandasParquetSerializer())
 def feature_engineer(df_merged):
     logger = get_run_logger()
     logger.info("Engineering features ...")
     
     # Stage mapping
-    stage_map = {1: '1. Performing', 2: '2. Under-performing', 3: '3. NPL'}
-    df_merged['Stage_Name'] = df_merged['STAGE_CIF'].map(stage_map).fillna('0. Unknown')
+    stage = df_merged['STAGE_CIF'].to_numpy(dtype='int8', na_value=0)
+    codes = np.where(np.isin(stage, [1, 2, 3]), stage, 0).astype('int8')
+    df_merged['Stage_Name'] = pd.Categorical.from_codes(codes, categories=STAGE_NAMES)
     
-    df_merged['Is_Overdue'] = df_merged['FDPDUE00'] > 0
+    dpd = df_merged['FDPDUE00'].to_numpy()
+    df_merged['Is_Overdue'] = dpd > 0
     
-    bins = [-1, 0, 30, 60, 90, float('inf')]
-    labels = ['0. No DPD','1. 1-30 Days','2. 31-60 Days','3. 61-90 Days','4. 90+ Days']
-    df_merged['DPD_Bucket'] = pd.cut(df_merged['FDPDUE00'], bins=bins, labels=labels, right=True)
+    # ช่วงเป็นแบบปิดขวา (-1, 0], (0, 30], ... เหมือน pd.cut(right=True)
+    codes = np.searchsorted(np.array([0, 30, 60, 90], dtype=dpd.dtype), dpd, side='left').astype('int8')
+    codes[~(dpd > -1)] = -1
+    df_merged['DPD_Bucket'] = pd.Categorical.from_codes(codes, categories=DPD_LABELS, ordered=True)
     
+    # FFLGBWFW ในไฟล์เป็น flag (F/N) จึงยังต้อง coerce เป็น numeric
     df_merged['FFLGBWFW'] = pd.to_numeric(df_merged['FFLGBWFW'], errors='coerce')
-    df_merged['FPRINCAM'] = pd.to_numeric(df_merged['FPRINCAM'], errors='coerce')
     
-    df_merged['Debt_to_Limit_Ratio'] = np.where(
-        df_merged['FFLGBWFW'] > 0,
-        df_merged['FPRINCAM'] / df_merged['FFLGBWFW'],
-        np.nan
-    )
+    limit = df_merged['FFLGBWFW'].to_numpy(dtype='float64')
+    ratio = np.full(len(limit), np.nan)
+    np.divide(df_merged['FPRINCAM'].to_numpy(dtype='float64'), limit, out=ratio, where=limit > 0)
+    df_merged['Debt_to_Limit_Ratio'] = ratio
     
-    df_merged['Loan_Age_Days'] = (df_merged['FRPDATE'] - df_merged['FORDATE']).dt.days
-    df_merged['Remaining_Tenor_Days'] = (df_merged['FMATDATE'] - df_merged['FRPDATE']).dt.days
-    df_merged['Loan_Orig_Year'] = df_merged['FORDATE'].dt.year
-    df_merged['Loan_Orig_Quarter'] = df_merged['FORDATE'].dt.quarter
+    df_merged['Loan_Age_Days'] = days_between(df_merged['FRPDATE'], df_merged['FORDATE'])
+    df_merged['Remaining_Tenor_Days'] = days_between(df_merged['FMATDATE'], df_merged['FRPDATE'])
+    df_merged['Loan_Orig_Year'], df_merged['Loan_Orig_Quarter'] = year_quarter(df_merged['FORDATE'])
     
     logger.info("Features created successfully")
     return df_merged
 
 @task
-def create_report(df_final, report_date: str):
+def create_report(df_final, report_date: str, dpi: int = 150):
     logger = get_run_logger()
     logger.info("Creating dashboard report ...")
     
-    report_by_stage = df_final.groupby('Stage_Name')['FPRINCAM'].agg(['sum', 'mean', 'count'])
+    report_by_stage = stage_summary(df_final)
+
+    # mask ของกลุ่ม DPD 90+ คำนวณครั้งเดียวบน int16 buffer แล้วใช้ slice เดียวกันทุก panel
+    dpd = df_final['FDPDUE00'].to_numpy()
+    npl_90 = dpd > 90
+    npl_dpd = dpd[npl_90]
     
     sns.set_theme(style="darkgrid", palette="Blues_d", font="Tahoma")
     fig, axes = plt.subplots(2, 2, figsize=(18, 14))
@@ -101,37 +163,79 @@ def create_report(df_final, report_date: str):
     axes[0, 0].set_title('Account Count by Stage', fontsize=14, fontweight='bold')
     
     # Bar Chart
-    sns.barplot(ax=axes[0, 1], data=report_by_stage.reset_index(),
-                x='Stage_Name', y='sum', palette='viridis')
+    axes[0, 1].bar(report_by_stage.index.astype(str), report_by_stage['sum'].to_numpy(),
+                   color=sns.color_palette('viridis', len(report_by_stage)))
+    axes[0, 1].set_xlabel('Stage_Name')
+    axes[0, 1].set_ylabel('sum')
     axes[0, 1].set_title('Total Principal by Stage', fontsize=14, fontweight='bold')
     
     # Box Plot
-    sns.boxplot(ax=axes[1, 0], data=df_final, x='FPRODTY', y='FPRINCAM', palette='Set2')
+    by_product = df_final.groupby('FPRODTY', observed=True)['FPRINCAM']
+    products = [str(k) for k, _ in by_product]
+    groups = [g.dropna().to_numpy() for _, g in by_product]
+    box = axes[1, 0].boxplot(groups, patch_artist=True, medianprops={'color': '0.25'},
+                             flierprops={'marker': '.', 'markersize': 2})
+    for flier in box['fliers']:
+        flier.set_rasterized(True)
+    for patch, color in zip(box['boxes'], sns.color_palette('Set2', len(groups))):
+        patch.set_facecolor(color)
+    axes[1, 0].set_xticks(range(1, len(products) + 1), products)
+    axes[1, 0].set_xlabel('FPRODTY')
+    axes[1, 0].set_ylabel('FPRINCAM')
     axes[1, 0].set_title('Principal Distribution by Product', fontsize=14, fontweight='bold')
     axes[1, 0].set_ylim(0, 12000000)
     
     # Histogram
-    df_npl_90 = df_final[df_final['FDPDUE00'] > 90]
-    sns.histplot(ax=axes[1, 1], data=df_npl_90, x='FDPDUE00',
-                 bins=20, kde=True, color='crimson', alpha=0.7)
+    hist, edges = np.histogram(npl_dpd, bins=20)
+    axes[1, 1].bar(edges[:-1], hist, width=np.diff(edges), align='edge',
+                   color='crimson', alpha=0.7, edgecolor='white')
+    if npl_dpd.size > 1 and npl_dpd.std() > 0:
+        grid, density = kde_curve(npl_dpd)
+        axes[1, 1].plot(grid, density * npl_dpd.size * (edges[1] - edges[0]), color='crimson')
+    axes[1, 1].set_xlabel('FDPDUE00')
+    axes[1, 1].set_ylabel('Count')
     axes[1, 1].set_title('DPD Distribution (90+ Days)', fontsize=14, fontweight='bold')
     
     plt.tight_layout(rect=[0, 0.03, 1, 0.96])
     output_file = f'monthly_dashboard_{report_date}.png'
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi)
+    plt.close(fig)
     logger.info(f"Dashboard saved as {output_file}")
 
 # ---------------- Flow ---------------- #
 @flow(name="NPL Report Flow")
-def run_report_flow(report_date: str):
-    df_tran, df_perf = load_data(report_date)
+def run_report_flow(report_date: str, dpi: int = 150):
+    # สอง task อ่านไฟล์ไม่ขึ้นต่อกัน ให้ task runner รันพร้อมกัน
+    df_tran = load_data.submit(report_date)
+    df_perf = load_performance.submit()
     df_merged = clean_data(df_tran, df_perf)
     df_final = feature_engineer(df_merged)
-    create_report(df_final, report_date)
+    create_report(df_final, report_date, dpi)
     print(f"Flow completed for {report_date}")
 
+def run_one(report_date: str, dpi: int = 150):
+    """จุดเข้าของแต่ละ process (Flow object ส่งข้าม process ด้วย pickle ไม่ได้)"""
+    run_report_flow(report_date, dpi)
+
+def run_many(report_dates, dpi: int = 150):
+    """รัน flow ของแต่ละวันที่รายงานพร้อมกัน วันละหนึ่ง process"""
+    # สร้าง Performance cache ก่อนแยก process เพื่อไม่ให้หลาย process เขียนไฟล์เดียวกัน
+    read_performance()
+    # worker แบบ spawn ที่ปิดตัวตามปกติ จึงได้รัน atexit ซึ่งปิด temporary Prefect server ของ process นั้น
+    with ProcessPoolExecutor(max_workers=min(len(report_dates), os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context('spawn')) as ex:
+        list(ex.map(partial(run_one, dpi=dpi), report_dates))
+
 # ---------------- Run ---------------- #
 if __name__ == "__main__":
     import sys
-    report_date = sys.argv[1] if len(sys.argv) > 1 else "20240731"
-    run_report_flow(report_date)
+    # วันที่รายงานหลายวันคั่นด้วย comma เช่น 20240630,20240731
+    arg = sys.argv[1] if len(sys.argv) > 1 else "20240731"
+    report_dates = [d.strip() for d in arg.split(',') if d.strip()]
+    if not report_dates:
+        sys.exit('ต้องระบุวันที่รายงานอย่างน้อยหนึ่งวัน')
+    dpi = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    if len(report_dates) > 1:
+        run_many(report_dates, dpi)
+    else:
+        run_report_flow(report_dates[0], dpi)